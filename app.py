@@ -1,13 +1,71 @@
 import streamlit as st
 import joblib
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
 import pandas as pd
 import numpy as np
 import requests
+from collections import OrderedDict
 from datetime import datetime
+from types import MappingProxyType
 import json
+import numbers
+import queue
+import threading
+import time
 
 from huggingface_hub import hf_hub_download
 import os
+import tempfile
+import xxhash
+import onnxruntime as ort
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+# --- ONNX Export Cache ---
+# The forest is served from a float32 ONNX export cached next to its joblib pickle. The
+# export records the size and mtime of the pickle it was built from, so a replaced pickle,
+# or a missing, unreadable or untagged export, gets re-exported instead of served.
+EXPORT_SOURCE_KEY = 'source_pickle'
+
+def onnx_export_path(model_path):
+    return os.path.splitext(model_path)[0] + '.onnx'
+
+def model_signature(model_path):
+    stat = os.stat(model_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def export_matches_source(session, model_path):
+    source = session.get_modelmeta().custom_metadata_map.get(EXPORT_SOURCE_KEY)
+    return source is not None and source == model_signature(model_path)
+
+# Returns a session on the cached export, or None if it has to be (re)built first
+def open_onnx_session(model_path, sess_options):
+    try:
+        session = ort.InferenceSession(onnx_export_path(model_path), sess_options, providers=['CPUExecutionProvider'])
+    except Exception:
+        return None
+    return session if export_matches_source(session, model_path) else None
+
+def export_onnx_model(model_path):
+    onnx_model_path = onnx_export_path(model_path)
+    model = joblib.load(model_path, mmap_mode='r')
+    onnx_model = convert_sklearn(model, initial_types=[('input', FloatTensorType([None, model.n_features_in_]))])
+    source = onnx_model.metadata_props.add()
+    source.key, source.value = EXPORT_SOURCE_KEY, model_signature(model_path)
+    # Each process writes its own temp file in the target directory and os.replace publishes
+    # it atomically, so concurrent cold starts can't interleave writes into one export
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(onnx_model_path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(onnx_model.SerializeToString())
+        os.replace(tmp_path, onnx_model_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return onnx_model_path
 
 def download_from_hf():
     repo_id = "Mohanad49/Car_price_model"
@@ -25,31 +83,234 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- Batched Inference ---
+# Concurrent sessions push their input rows onto a shared queue; a single worker
+# takes up to MAX_BATCH queued rows and runs one transform + predict call for the
+# whole batch. It never waits for more rows: requests that arrive while a batch is
+# running are already queued when the next one starts, so batches grow with load
+# and a lone request is predicted immediately.
+MAX_BATCH = 32
+
+def batch_predict_worker(request_queue, session, preprocess):
+    while True:
+        batch = [request_queue.get()]
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(request_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            num_rows = np.vstack([num_buf for (num_buf, _), _, _ in batch])
+            cat_rows = np.vstack([cat_buf for (_, cat_buf), _, _ in batch])
+            predictions = session.run(None, {'input': preprocess(num_rows, cat_rows)})[0].ravel()
+        except Exception as e:
+            # Hand the error back to every waiting session as a ValueError: onnxruntime's
+            # Fail / InvalidArgument derive from Exception directly, and a malformed row can
+            # raise IndexError in the compiled preprocessing
+            error = ValueError(f"{type(e).__name__}: {e}")
+            error.__cause__ = e
+            predictions = [error] * len(batch)
+        for (_, done, result), prediction in zip(batch, predictions):
+            result.append(prediction)
+            done.set()
+
+def submit(request_queue, num_buf, cat_buf):
+    done = threading.Event()
+    result = []
+    request_queue.put(((num_buf, cat_buf), done, result))
+    done.wait()
+    if isinstance(result[0], Exception):
+        raise result[0]
+    return float(result[0])
+
+# --- Compiled Preprocessing ---
+# The fitted ColumnTransformer is lowered once to plain NumPy: numeric blocks become
+# impute + (x - mean) / scale and categorical blocks become one-hot index stores, so a
+# batch goes straight from the typed input buffers to the float32 model input without
+# building a DataFrame. Returns None for any step it doesn't know how to lower.
+def compile_preprocessor(preprocessor, num_idx, cat_idx, original_cols, n_features):
+    num_blocks, cat_blocks = [], []
+    n_out = 0
+    for _, transformer, cols in preprocessor.transformers_:
+        cols = resolve_columns(cols, original_cols)
+        if (isinstance(transformer, str) and transformer == 'drop') or len(cols) == 0:
+            continue
+        if isinstance(transformer, str):
+            steps = [] if transformer == 'passthrough' else None
+        else:
+            steps = [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer]
+        if steps is None:
+            return None
+        if all(c in num_idx for c in cols):
+            fill = mean = scale = None
+            for i, step in enumerate(steps):
+                if isinstance(step, SimpleImputer) and i == 0 and pd.isna(step.missing_values) and not step.add_indicator:
+                    fill = step.statistics_.astype(np.float64)
+                    if np.isnan(fill).any():
+                        return None  # Imputer drops all-NaN features; not worth mirroring
+                elif isinstance(step, StandardScaler) and i == len(steps) - 1:
+                    mean = step.mean_ if step.with_mean else None
+                    scale = step.scale_ if step.with_std else None
+                else:
+                    return None
+            num_blocks.append(([num_idx[c] for c in cols], fill, mean, scale, n_out))
+            n_out += len(cols)
+        elif all(c in cat_idx for c in cols):
+            fill = lookups = None
+            for i, step in enumerate(steps):
+                if isinstance(step, SimpleImputer) and i == 0 and pd.isna(step.missing_values) and not step.add_indicator:
+                    fill = step.statistics_
+                elif (isinstance(step, OneHotEncoder) and i == len(steps) - 1 and step.handle_unknown == 'ignore'
+                        and step.drop_idx_ is None and step.min_frequency is None and step.max_categories is None):
+                    lookups = []
+                    for categories in step.categories_:
+                        lookups.append({category: n_out + k for k, category in enumerate(categories)})
+                        n_out += len(categories)
+                else:
+                    return None
+            if lookups is None:
+                return None
+            cat_blocks.append(([cat_idx[c] for c in cols], fill, lookups))
+        else:
+            return None
+    if n_out != n_features:
+        return None
+
+    def preprocess(num_rows, cat_rows):
+        out = np.zeros((len(num_rows), n_out), dtype=np.float32)
+        for idx, fill, mean, scale, start in num_blocks:
+            x = num_rows[:, idx]
+            if fill is not None:
+                x = np.where(np.isnan(x), fill, x)
+            if mean is not None:
+                x = x - mean
+            if scale is not None:
+                x = x / scale
+            out[:, start:start + len(idx)] = x
+        for idx, fill, lookups in cat_blocks:
+            for row, values in enumerate(cat_rows[:, idx]):
+                for j, value in enumerate(values):
+                    if fill is not None and (value is None or value != value):
+                        value = fill[j]
+                    # Unknown categories encode as all zeros, like handle_unknown='ignore'
+                    pos = lookups[j].get(value)
+                    if pos is not None:
+                        out[row, pos] = 1.0
+        return out
+    return preprocess
+
+# Fallback for pipelines compile_preprocessor can't lower: rebuild the DataFrame the
+# ColumnTransformer expects and let it do the work
+def column_transformer_preprocess(preprocessor, num_idx, cat_idx, original_cols):
+    num_cols, cat_cols, ordered_cols = list(num_idx), list(cat_idx), list(original_cols)
+
+    def preprocess(num_rows, cat_rows):
+        batch_df = pd.concat([
+            pd.DataFrame(num_rows, columns=num_cols),
+            pd.DataFrame(cat_rows, columns=cat_cols)
+        ], axis=1)[ordered_cols]
+        return preprocessor.transform(batch_df).astype(np.float32)
+    return preprocess
+
 # --- Load Model, Preprocessor, and Original Column Names ---
-@st.cache_resource
-def load_resources():
+# A fitted ColumnTransformer may select columns by name, position, boolean mask or slice
+# (the remainder is always stored as positions); map any of them to column names
+def resolve_columns(cols, original_cols):
+    if isinstance(cols, str):
+        return [cols]
+    if isinstance(cols, slice):
+        # Label slices include their stop column, like DataFrame.loc
+        start = original_cols.index(cols.start) if isinstance(cols.start, str) else cols.start
+        stop = original_cols.index(cols.stop) + 1 if isinstance(cols.stop, str) else cols.stop
+        return list(original_cols[start:stop:cols.step])
+    cols = np.asarray(cols)
+    if cols.dtype.kind in 'biu':
+        return list(np.asarray(original_cols, dtype=object)[cols])
+    return list(cols)
+
+# Column -> buffer index maps for the numeric and categorical inputs, split the same
+# way the fitted ColumnTransformer splits them (one-hot encoded columns are categorical)
+def build_feature_index(preprocessor, original_cols):
+    one_hot_cols = set()
+    for _, transformer, cols in preprocessor.transformers_:
+        last_step = transformer.steps[-1][1] if isinstance(transformer, Pipeline) else transformer
+        if isinstance(last_step, OneHotEncoder):
+            one_hot_cols.update(resolve_columns(cols, original_cols))
+    num_cols = [c for c in original_cols if c not in one_hot_cols]
+    cat_cols = [c for c in original_cols if c in one_hot_cols]
+    return {c: i for i, c in enumerate(num_cols)}, {c: i for i, c in enumerate(cat_cols)}
+
+# cache_resource keeps the deserialized artifacts (and the worker thread) in process memory
+# across reruns and sessions; the only arguments are path strings, so the cache key is cheap
+@st.cache_resource(show_spinner="Loading model…")
+def load_artifacts(model_path='rf_model.joblib', preprocessor_path='preprocessor.joblib', columns_path='original_feature_columns.joblib'):
     try:
-        model = joblib.load('rf_model.joblib')
-        preprocessor = joblib.load('preprocessor.joblib')
-        original_cols = joblib.load('original_feature_columns.joblib')
+        # mmap_mode='r' maps the pickled numpy arrays from the file instead of copying them,
+        # so processes on the same host share one copy through the OS page cache
+        preprocessor = joblib.load(preprocessor_path, mmap_mode='r')
+        original_cols = joblib.load(columns_path)
+        # Column schema as one tuple, read once from the fitted preprocessor (falling back to the
+        # saved column list), so reruns never walk the sklearn object for it again
+        original_cols = tuple(getattr(preprocessor, 'feature_names_in_', original_cols))
+        num_idx, cat_idx = build_feature_index(preprocessor, original_cols)
+        sess_options = ort.SessionOptions()
+        # Trees are independent, so let onnxruntime spread the ensemble across the CPUs this
+        # process is allowed to run on (its affinity mask / cpuset, not every CPU on the host).
+        # Spinning is off so idle pool threads sleep between batches instead of burning the
+        # cycles other worker processes on the same host need for their own predictions.
+        usable_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        sess_options.intra_op_num_threads = usable_cpus or 1
+        sess_options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        # Convert the forest to ONNX once so tree traversal runs in onnxruntime's C++ kernels.
+        # The export keeps thresholds/leaf values as float32 and is saved next to the joblib
+        # file, so later cold starts never unpickle the float64 scikit-learn forest at all.
+        session = open_onnx_session(model_path, sess_options)
+        if session is None:
+            session = ort.InferenceSession(export_onnx_model(model_path), sess_options, providers=['CPUExecutionProvider'])
+        n_features = session.get_inputs()[0].shape[1]
+        fallback_preprocess = column_transformer_preprocess(preprocessor, num_idx, cat_idx, original_cols)
+        warmup_num = np.full((1, len(num_idx)), np.nan)
+        warmup_cat = np.full((1, len(cat_idx)), 'Unknown', dtype=object)
+        warmup_input = fallback_preprocess(warmup_num, warmup_cat)
+        try:
+            preprocess = compile_preprocessor(preprocessor, num_idx, cat_idx, original_cols, n_features)
+            # Only serve the compiled path if it reproduces ColumnTransformer.transform on the warm-up row
+            if preprocess is not None and not np.allclose(preprocess(warmup_num, warmup_cat), warmup_input, rtol=1e-6, atol=1e-6):
+                print("Compiled preprocessor disagrees with ColumnTransformer.transform.")
+                preprocess = None
+        except Exception as e:
+            print(f"Compiling the preprocessor failed: {e}")
+            preprocess = None
+        if preprocess is None:
+            print("Preprocessor could not be compiled to NumPy; using ColumnTransformer.transform.")
+            preprocess = fallback_preprocess
+        # Warm-up pass so the first real prediction doesn't pay for pulling cold tree nodes into cache
+        session.run(None, {'input': warmup_input})
+        # The queue lives in the cached resource (not at module level) because Streamlit
+        # re-executes this script on every rerun, while the worker thread must outlive it
+        predict_queue = queue.Queue()
+        threading.Thread(target=batch_predict_worker, args=(predict_queue, session, preprocess), daemon=True).start()
         print("Resources loaded successfully.")
         # print(f"Original columns expected by preprocessor: {original_cols}")
-        return model, preprocessor, original_cols
+        return session, preprocessor, original_cols, predict_queue, num_idx, cat_idx
     except FileNotFoundError as e:
-        st.error(f"Error loading model/preprocessor/columns files: {e}. Ensure 'rf_model.joblib', 'preprocessor.joblib', and 'original_feature_columns.joblib' are in the same directory as app.py.")
-        return None, None, None
+        st.error(f"Error loading model/preprocessor/columns files: {e}. Ensure '{model_path}', '{preprocessor_path}', and '{columns_path}' are in the same directory as app.py.")
+        return None, None, None, None, None, None
     except Exception as e:
         st.error(f"An unexpected error occurred while loading resources: {e}")
-        return None, None, None
+        return None, None, None, None, None, None
 
-model, preprocessor, original_feature_columns = load_resources()
+session, preprocessor, original_feature_columns, predict_queue, num_idx, cat_idx = load_artifacts()
 
 # --- Define Currency Conversion Function ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def get_exchange_rates():
+RATES_TTL = 3600  # Refresh rates after 1 hour
+# Default fallback rates including EGP
+FALLBACK_RATES = {"USD": 1.0, "EUR": 0.85, "GBP": 0.75, "JPY": 110.0, "CAD": 1.25, "AUD": 1.35, "EGP": 50}
+
+def fetch_exchange_rates():
     try:
         # Using ExchangeRate-API for demo purposes
-        response = requests.get("https://open.er-api.com/v6/latest/USD")
+        response = requests.get("https://open.er-api.com/v6/latest/USD", timeout=2)
         data = response.json()
         if data["result"] == "success":
             rates = data["rates"]
@@ -57,35 +318,61 @@ def get_exchange_rates():
             if "EGP" not in rates:
                 rates["EGP"] = 50  # Approximate rate as of May 2024
             return rates
-        else:
-            # Default fallback rates including EGP
-            return {"USD": 1.0, "EUR": 0.85, "GBP": 0.75, "JPY": 110.0, "CAD": 1.25, "AUD": 1.35, "EGP": 50}
-    except:
-        # Default fallback rates including EGP
-        return {"USD": 1.0, "EUR": 0.85, "GBP": 0.75, "JPY": 110.0, "CAD": 1.25, "AUD": 1.35, "EGP": 50}
+    except Exception:
+        pass
+    return None
+
+# Last known rates shared by all sessions; cache_resource keeps it alive across reruns
+@st.cache_resource
+def exchange_rates_state():
+    return {"value": None, "ts": 0.0, "refreshing": False, "lock": threading.Lock()}
+
+def refresh_exchange_rates(state):
+    rates = fetch_exchange_rates()
+    with state["lock"]:
+        if rates is not None:
+            state["value"], state["ts"] = rates, time.time()
+        state["refreshing"] = False
+
+# Stale-while-revalidate: expired rates are still served immediately while a
+# background thread fetches fresh ones, so the HTTP call stays off the rerun path
+def get_exchange_rates():
+    state = exchange_rates_state()
+    with state["lock"]:
+        rates = state["value"]
+        if rates is not None:
+            if time.time() - state["ts"] >= RATES_TTL and not state["refreshing"]:
+                state["refreshing"] = True
+                threading.Thread(target=refresh_exchange_rates, args=(state,), daemon=True).start()
+            return rates
+    # Nothing cached yet: fetch synchronously, falling back to defaults until the next refresh
+    rates = fetch_exchange_rates() or dict(FALLBACK_RATES)
+    with state["lock"]:
+        state["value"], state["ts"] = rates, time.time()
+    return rates
 
 # --- Define Theme Settings ---
-def set_theme():
-    # Dark theme colors only
-    primary_color = "#3498db"  # Blue
-    secondary_color = "#2ecc71"  # Green
-    background_color = "#121212"
-    text_color = "#f1f1f1"
-    card_bg_color = "#1e1e1e"
+# Dark theme colors only
+THEME = {
+    "primary_color": "#3498db",  # Blue
+    "secondary_color": "#2ecc71",  # Green
+    "background_color": "#121212",
+    "text_color": "#f1f1f1",
+    "card_bg_color": "#1e1e1e"
+}
+
+# The CSS never changes between reruns, so build the string once per process
+@st.cache_resource
+def _build_css():
+    primary_color = THEME["primary_color"]
+    secondary_color = THEME["secondary_color"]
+    background_color = THEME["background_color"]
+    text_color = THEME["text_color"]
+    card_bg_color = THEME["card_bg_color"]
     bg_image = "https://images.unsplash.com/photo-1583121274602-3e2820c69888?q=80&w=1920&auto=format&fit=crop&ixlib=rb-4.0.3"
     fallback_bg = "linear-gradient(135deg, #121212, #1e1e1e, #121212)"
     
-    # Store theme colors in session state for later use
-    st.session_state.theme = {
-        "primary_color": primary_color,
-        "secondary_color": secondary_color,
-        "background_color": background_color,
-        "text_color": text_color,
-        "card_bg_color": card_bg_color
-    }
-    
-    # Apply theme
-    st.markdown(f"""
+    return f"""
     <style>
     /* Base Theme */
     body {{
@@ -120,7 +407,7 @@ def set_theme():
     }}
     
     /* Buttons */
-    .stButton > button {{
+    .stButton > button, .stFormSubmitButton > button {{
         background-color: {primary_color};
         color: white !important;
         border: none;
@@ -131,7 +418,7 @@ def set_theme():
         position: relative;
     }}
     
-    .stButton > button:hover {{
+    .stButton > button:hover, .stFormSubmitButton > button:hover {{
         background-color: {secondary_color};
         transform: translateY(-2px);
         box-shadow: 0 4px 8px rgba(0,0,0,0.1);
@@ -243,16 +530,23 @@ def set_theme():
         overflow-y: auto !important;
     }}
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def apply_theme():
+    # Store theme colors in session state for later use
+    st.session_state.theme = dict(THEME)
+    st.markdown(_build_css(), unsafe_allow_html=True)
 
 # --- Define Unique Categories for Selectboxes (from your Kaggle output) ---
 # Helper function to prepare selectbox options (handles nan -> "Unknown", sorts)
+# Cached so the conversion runs once rather than on every rerun; pass tuples so args are hashable
+@st.cache_data(show_spinner=False)
 def prepare_options(raw_list, nan_replacement="Unknown", sort=True):
     # Replace actual np.nan with the string replacement, then convert all to string
     options_str = [nan_replacement if pd.isna(item) else str(item) for item in raw_list]
     if sort:
         # Get unique sorted list
-        unique_sorted_options = sorted(list(set(options_str)))
+        unique_sorted_options = sorted(dict.fromkeys(options_str))
         return unique_sorted_options
     return list(set(options_str)) # Just unique if no sort needed
 
@@ -265,45 +559,123 @@ transmission_opts_raw = ['A', 'CVT', 'M', np.nan, 'Dual Clutch']
 wheel_system_opts_raw = ['4WD', 'FWD', 'AWD', np.nan, 'RWD', '4X2']
 
 # Prepare options for UI
-body_type_options = prepare_options(body_type_opts_raw)
-engine_cylinders_options = prepare_options(engine_cylinders_opts_raw)
-engine_type_options = prepare_options(engine_type_opts_raw)
-fuel_type_options = prepare_options(fuel_type_opts_raw)
-listing_color_options = prepare_options(listing_color_opts_raw, nan_replacement="UNKNOWN") # Use UNKNOWN if it's a category
+body_type_options = prepare_options(tuple(body_type_opts_raw))
+engine_cylinders_options = prepare_options(tuple(engine_cylinders_opts_raw))
+engine_type_options = prepare_options(tuple(engine_type_opts_raw))
+fuel_type_options = prepare_options(tuple(fuel_type_opts_raw))
+listing_color_options = prepare_options(tuple(listing_color_opts_raw), nan_replacement="UNKNOWN") # Use UNKNOWN if it's a category
 transmission_options_map = {'A': 'Automatic', 'M': 'Manual', 'CVT': 'CVT', 'Dual Clutch': 'Dual Clutch', 'Unknown': 'Unknown'}
-prepared_trans_opts = prepare_options(transmission_opts_raw)
+display_to_original_trans = {v: k for k, v in transmission_options_map.items()}
+prepared_trans_opts = prepare_options(tuple(transmission_opts_raw))
 display_trans_opts = [transmission_options_map.get(opt, opt) for opt in prepared_trans_opts]
-wheel_system_options = prepare_options(wheel_system_opts_raw)
-
-
-numerical_cols = [
-    'back_legroom', 'city_fuel_economy', 'daysonmarket', 'engine_displacement', 
-    'fleet', 'frame_damaged', 'franchise_dealer', 'front_legroom', 
-    'fuel_tank_volume', 'has_accidents', 'height', 'highway_fuel_economy', 
-    'horsepower', 'isCab', 'is_new', 'length', 'maximum_seating', 
-    'mileage', 'owner_count', 'salvage', 'savings_amount', 'seller_rating', 
-    'theft_title', 'wheelbase', 'width', 'car_age'
-]
-
-# Define expected dtypes for conversion (simplified)
-# We'll assume columns NOT in categorical_widget_map are numeric if they are in original_feature_columns
-# This map helps us know which columns get string inputs from selectboxes
-categorical_widget_map = {
-    'body_type': body_type_options,
-    'engine_cylinders': engine_cylinders_options,
-    'engine_type': engine_type_options,
-    'fuel_type': fuel_type_options,
-    'listing_color': listing_color_options,
-    'transmission': display_trans_opts, # Use display options here for widget
-    'wheel_system': wheel_system_options
-}
-# Boolean flags will be handled separately as they map to 0/1
-boolean_flags = ['fleet', 'frame_damaged', 'franchise_dealer', 'has_accidents', 'isCab', 'is_new', 'salvage', 'theft_title']
+wheel_system_options = prepare_options(tuple(wheel_system_opts_raw))
+
+
+# Numeric and categorical inputs are collected into separate typed buffers, indexed by
+# num_idx / cat_idx (built once in load_artifacts), so the input DataFrame is built
+# without pandas' per-value type inference
+num_feature_cols = list(num_idx or [])
+cat_feature_cols = list(cat_idx or [])
+
+def build_input_df(num_buf, cat_buf):
+    return pd.concat([
+        pd.DataFrame(num_buf, columns=num_feature_cols),
+        pd.DataFrame(cat_buf, columns=cat_feature_cols)
+    ], axis=1)[list(original_feature_columns)]
+
+# Type check run before the typed buffers are filled: every collected value must fit the
+# buffer its column goes into (build_feature_index already splits the columns exactly).
+# Returns an error message, or None if the row is safe to build and send to the model.
+def _validate_input(widget_values):
+    bad_num = [c for c, v in widget_values.items() if c in num_idx and not (v is None or isinstance(v, numbers.Real))]
+    if bad_num:
+        return f"numeric inputs must be numbers: {', '.join(bad_num)}"
+    bad_cat = [c for c, v in widget_values.items() if c in cat_idx and not isinstance(v, str)]
+    if bad_cat:
+        return f"categorical inputs must be text: {', '.join(bad_cat)}"
+    return None
+
+# --- Cached Prediction ---
+# USD predictions keyed on the feature row only, so re-predicting after a currency change
+# skips the model. The key is one xxh64 pass over the typed buffers, which is much cheaper
+# than st.cache_data's pickle-based argument hashing. The cache is shared by all sessions
+# and keeps the PREDICTION_CACHE_SIZE most recently used rows.
+PREDICTION_CACHE_SIZE = 256
 
+@st.cache_resource
+def prediction_cache():
+    return OrderedDict(), threading.Lock()
+
+def row_key(num_buf, cat_buf):
+    h = xxhash.xxh64(num_buf.tobytes())
+    # The object buffer only holds pointers, so hash the category strings themselves
+    h.update('\x1f'.join(cat_buf[0]).encode())
+    return h.intdigest()
+
+def predict_usd(num_buf, cat_buf):
+    cache, lock = prediction_cache()
+    key = row_key(num_buf, cat_buf)
+    with lock:
+        prediction = cache.get(key)
+        if prediction is not None:
+            cache.move_to_end(key)
+    if prediction is None:
+        prediction = submit(predict_queue, num_buf, cat_buf)
+        with lock:
+            cache[key] = prediction
+            if len(cache) > PREDICTION_CACHE_SIZE:
+                cache.popitem(last=False)
+    return prediction
+
+# --- Result Card Assets ---
+# Car image based on body type, built once at import instead of inside the predict handler
+_BODY_IMAGE_URLS = MappingProxyType({
+    "Sedan": "https://img.icons8.com/color/96/000000/sedan.png",
+    "SUV / Crossover": "https://img.icons8.com/color/96/000000/suv.png",
+    "Pickup Truck": "https://img.icons8.com/color/96/000000/pickup.png",
+    "Coupe": "https://img.icons8.com/external-flaticons-lineal-color-flat-icons/64/external-coupe-automotive-ecommerce-flaticons-lineal-color-flat-icons-3.png",
+    "Convertible": "https://img.icons8.com/color/96/000000/convertible.png",
+    "Wagon": "https://img.icons8.com/color/96/000000/station-wagon.png",
+    "Minivan": "https://img.icons8.com/external-flaticons-lineal-color-flat-icons/64/external-minivan-automotive-ecommerce-flaticons-lineal-color-flat-icons.png",
+    "Van": "https://img.icons8.com/color/96/000000/van.png",
+    "Hatchback": "https://img.icons8.com/color/96/000000/hatchback.png"
+})
+_DEFAULT_BODY_IMAGE_URL = "https://img.icons8.com/color/96/000000/car.png"
+# Body-type card shown under the predicted price; filled in with str.format per prediction
+_RESULT_CARD_TMPL = """
+<div style="display: flex; justify-content: center; margin: 20px 0; background-color: rgba(255,255,255,0.2); padding: 20px; border-radius: 50%; width: 120px; height: 120px; margin-left: auto; margin-right: auto; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px);">
+    <img src="{car_image_url}" width="96" height="96" alt="{body_type}" style="object-fit: contain;">
+</div>
+<div style="text-align: center; margin-bottom: 30px; background-color: rgba(0,0,0,0.2); padding: 10px; border-radius: 8px; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px);">
+    <span style="font-weight: bold; color: white;">{body_type}</span>
+</div>
+"""
+
+# --- Static Page Chrome ---
+# Each st.markdown call is its own element and delta message, so the fixed HTML around the
+# form is grouped into two strings. They are still emitted on every run: Streamlit removes
+# any element that a rerun doesn't render again.
+# Title area with a semi-transparent backdrop, introduction card and divider
+_HEADER_HTML = """
+<div class="animate-fadeIn">
+<div style="background-color: rgba(0,0,0,0.6); padding: 20px; border-radius: 10px; margin-bottom: 20px; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px); box-shadow: 0 8px 32px 0 rgba(0,0,0,0.37);">
+    <h1 style="text-align: center; color: white !important; margin: 0;">🚗 Used Car Price Predictor</h1>
+</div>
+<div class="card animate-fadeIn" style="background-color: rgba(0,0,0,0.5); backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);">
+    <p style="font-size: 1.2em; text-align: center; color: white !important;">Enter the specifications of a used car to get an estimated market price in your selected currency.</p>
+</div>
+</div>
+<hr>
+"""
+# Modern footer and divider
+_FOOTER_HTML = """
+<div style="text-align: center; color: #888; font-size: 0.95em; margin-top: 40px; padding-bottom: 10px;">
+    Made with ❤️ by Mohanad &middot; Powered by Streamlit
+</div>
+<hr>
+"""
 
 # --- Main App Interface ---
-st.markdown('<div class="animate-fadeIn">', unsafe_allow_html=True)
-
 # How it works section
 with st.expander("How it works"):
     st.markdown("""
@@ -313,19 +685,15 @@ with st.expander("How it works"):
     4. Use the **Reset** button to start over.
     """)
 
-# Custom CSS for the title area with a semi-transparent backdrop
-st.markdown("""
-<div style="background-color: rgba(0,0,0,0.6); padding: 20px; border-radius: 10px; margin-bottom: 20px; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px); box-shadow: 0 8px 32px 0 rgba(0,0,0,0.37);">
-    <h1 style="text-align: center; color: white !important; margin: 0;">🚗 Used Car Price Predictor</h1>
-</div>
-""", unsafe_allow_html=True)
+# Title and introduction
+st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
 # App settings in sidebar
 with st.sidebar:
     st.markdown("### App Settings")
     
     # Set dark theme (no toggle)
-    set_theme()
+    apply_theme()
     
     # Currency selection
     currencies = {
@@ -346,6 +714,11 @@ with st.sidebar:
         key="currency_select"
     )
     
+    # Debug view of the model input, off by default so predictions don't serialize it
+    show_input_data = st.toggle("Show input data", value=False, key="show_input_data", help="Display the feature values sent to the model with each prediction.")
+    # Balloons are opt-in: the animation is sent to the browser on every prediction otherwise
+    celebrate = st.checkbox("Celebrate 🎈", value=False, key="celebrate")
+    
     # Get currency symbols for display
     currency_symbols = {
         "USD": "$",
@@ -371,16 +744,7 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"Last updated: {datetime.now().strftime('%B %d, %Y')}")
 
-# Introduction
-st.markdown("""
-<div class="card animate-fadeIn" style="background-color: rgba(0,0,0,0.5); backdrop-filter: blur(12px); -webkit-backdrop-filter: blur(12px);">
-    <p style="font-size: 1.2em; text-align: center; color: white !important;">Enter the specifications of a used car to get an estimated market price in your selected currency.</p>
-</div>
-""", unsafe_allow_html=True)
-
-st.markdown("---")
-
-if model is not None and preprocessor is not None and original_feature_columns is not None:
+if session is not None and preprocessor is not None and original_feature_columns is not None:
     # Reset button logic
     if st.button("Reset", type="secondary", use_container_width=True):
         for key in list(st.session_state.keys()):
@@ -388,201 +752,194 @@ if model is not None and preprocessor is not None and original_feature_columns i
                 del st.session_state[key]
         st.rerun()
 
-    col1, col2, col3 = st.columns(3)
     input_values_from_widgets = {} # To store raw widget outputs
     valid_inputs = True
 
-    with col1:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        st.subheader("Basic Info")
-        # Mileage
-        if 'mileage' in original_feature_columns:
-            mileage = st.number_input("Mileage", min_value=0, value=50000, step=1000, help="Total miles the car has been driven.")
-            if mileage > 300000:
-                st.warning("High mileage: This is above typical values for most used cars.")
-            elif mileage < 1000:
-                st.info("Very low mileage: Is this a nearly new car?")
-            input_values_from_widgets['mileage'] = mileage
-        # Car Age
-        if 'car_age' in original_feature_columns:
-            car_age = st.number_input("Car Age (years)", min_value=0, max_value=100, value=5, step=1, help="How many years since the car was manufactured.")
-            if car_age > 30:
-                st.warning("This is an unusually old car.")
-            elif car_age < 1:
-                st.info("Is this a new or nearly new car?")
-            input_values_from_widgets['car_age'] = car_age
-        # Horsepower
-        if 'horsepower' in original_feature_columns:
-            horsepower = st.number_input("Horsepower (HP)", min_value=10, max_value=1200, value=200, step=10, help="Engine power. Typical cars range from 70 to 400 HP.")
-            if horsepower > 1200 or horsepower < 10:
-                st.error("Horsepower must be between 10 and 1200.")
-                valid_inputs = False
-            elif horsepower > 600:
-                st.warning("High horsepower: This is above typical values for most cars.")
-            elif horsepower < 50:
-                st.info("Very low horsepower: Is this a compact or economy car?")
-            input_values_from_widgets['horsepower'] = horsepower
-        # Engine Displacement
-        if 'engine_displacement' in original_feature_columns:
-            engine_displacement = st.number_input("Engine Displacement (L)", min_value=0.1, max_value=10.0, value=2.5, step=0.1, format="%.1f", help="Total engine size in liters.")
-            if engine_displacement > 10.0 or engine_displacement < 0.1:
-                st.error("Engine displacement must be between 0.1 and 10.0.")
-                valid_inputs = False
-            elif engine_displacement > 6.0:
-                st.warning("Large engine displacement: This is above typical values for most cars.")
-            elif engine_displacement < 1.0:
-                st.info("Small engine: Is this a compact or hybrid car?")
-            input_values_from_widgets['engine_displacement'] = engine_displacement
-        # Fuel Tank Volume
-        if 'fuel_tank_volume' in original_feature_columns:
-            fuel_tank_volume = st.number_input("Fuel Tank Volume (gal)", min_value=1.0, max_value=100.0, value=15.0, step=0.1, format="%.1f", help="Capacity of the fuel tank in gallons.")
-            if fuel_tank_volume < 1.0 or fuel_tank_volume > 100.0:
-                st.error("Fuel tank volume must be between 1.0 and 100.0 gallons.")
-                valid_inputs = False
-            input_values_from_widgets['fuel_tank_volume'] = fuel_tank_volume
-        # City Fuel Economy
-        if 'city_fuel_economy' in original_feature_columns:
-            city_fuel_economy = st.number_input("City Fuel Economy (MPG)", min_value=1, max_value=150, value=20, step=1, help="Miles per gallon in city driving conditions.")
-            if city_fuel_economy < 1 or city_fuel_economy > 150:
-                st.error("City fuel economy must be between 1 and 150 MPG.")
-                valid_inputs = False
-            input_values_from_widgets['city_fuel_economy'] = city_fuel_economy
-        # Highway Fuel Economy
-        if 'highway_fuel_economy' in original_feature_columns:
-            highway_fuel_economy = st.number_input("Highway Fuel Economy (MPG)", min_value=1, max_value=150, value=30, step=1, help="Miles per gallon on highways.")
-            if highway_fuel_economy < 1 or highway_fuel_economy > 150:
-                st.error("Highway fuel economy must be between 1 and 150 MPG.")
-                valid_inputs = False
-            input_values_from_widgets['highway_fuel_economy'] = highway_fuel_economy
-        # Days on Market
-        if 'daysonmarket' in original_feature_columns:
-            daysonmarket = st.number_input("Days on Market", min_value=0, value=30, step=1, help="How many days the car has been listed for sale.")
-            if daysonmarket < 0:
-                st.error("Days on market cannot be negative.")
-                valid_inputs = False
-            input_values_from_widgets['daysonmarket'] = daysonmarket
-        # Previous Owners
-        if 'owner_count' in original_feature_columns:
-            owner_count = st.number_input("Previous Owners", min_value=0, max_value=10, value=1, step=1, help="Number of previous owners.")
-            if owner_count > 10 or owner_count < 0:
-                st.error("Value must be between 0 and 10.")
-                valid_inputs = False
-            input_values_from_widgets['owner_count'] = owner_count
-        # Savings Amount
-        if 'savings_amount' in original_feature_columns:
-            savings_amount = st.number_input("Savings Amount ($)", min_value=0, value=0, step=100, help="Discount or savings on the car price, if any.")
-            if savings_amount < 0:
-                st.error("Savings amount cannot be negative.")
-                valid_inputs = False
-            input_values_from_widgets['savings_amount'] = savings_amount
-        # Seller Rating
-        if 'seller_rating' in original_feature_columns:
-            seller_rating = st.number_input("Seller Rating (0-5)", min_value=0.0, max_value=5.0, value=4.0, step=0.1, format="%.1f", help="Rating of the seller (0 = worst, 5 = best).")
-            if seller_rating < 0 or seller_rating > 5:
-                st.error("Seller rating must be between 0 and 5.")
-                valid_inputs = False
-            input_values_from_widgets['seller_rating'] = seller_rating
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col2:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        st.subheader("Engine & Dimensions")
-        if 'back_legroom' in original_feature_columns: input_values_from_widgets['back_legroom'] = st.number_input("Back Legroom (in)", min_value=10.0, max_value=60.0, value=35.0, step=0.1, format="%.1f")
-        if 'front_legroom' in original_feature_columns: input_values_from_widgets['front_legroom'] = st.number_input("Front Legroom (in)", min_value=20.0, max_value=70.0, value=40.0, step=0.1, format="%.1f")
-        if 'height' in original_feature_columns: input_values_from_widgets['height'] = st.number_input("Height (in)", min_value=30.0, max_value=120.0, value=60.0, step=0.1, format="%.1f")
-        if 'length' in original_feature_columns: input_values_from_widgets['length'] = st.number_input("Length (in)", min_value=80.0, max_value=300.0, value=180.0, step=0.1, format="%.1f")
-        if 'wheelbase' in original_feature_columns: input_values_from_widgets['wheelbase'] = st.number_input("Wheelbase (in)", min_value=50.0, max_value=200.0, value=100.0, step=0.1, format="%.1f")
-        if 'width' in original_feature_columns: input_values_from_widgets['width'] = st.number_input("Width (in)", min_value=40.0, max_value=120.0, value=70.0, step=0.1, format="%.1f")
-        if 'maximum_seating' in original_feature_columns: input_values_from_widgets['maximum_seating'] = st.number_input("Max Seating", min_value=1, max_value=15, value=5, step=1)
-
-        if 'body_type' in original_feature_columns: input_values_from_widgets['body_type'] = st.selectbox("Body Type", options=body_type_options)
-        if 'engine_cylinders' in original_feature_columns: input_values_from_widgets['engine_cylinders'] = st.selectbox("Engine Cylinders", options=engine_cylinders_options)
-        if 'engine_type' in original_feature_columns: input_values_from_widgets['engine_type'] = st.selectbox("Engine Type", options=engine_type_options)
-        if 'fuel_type' in original_feature_columns: input_values_from_widgets['fuel_type'] = st.selectbox("Fuel Type", options=fuel_type_options)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col3:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        st.subheader("Condition & Status")
-        bool_options_map_display = {"No": 0, "Yes": 1} # For display
-        for flag_col, flag_label in [
-            ('fleet', "Fleet Vehicle?"), ('frame_damaged', "Frame Damaged?"),
-            ('franchise_dealer', "Franchise Dealer?"), ('has_accidents', "Accidents Reported?"),
-            ('isCab', "Was a Cab/Taxi?"), ('is_new', "Is New (<2 yrs old)?"),
-            ('salvage', "Salvage Title?"), ('theft_title', "Theft on Title?")
-        ]:
-            if flag_col in original_feature_columns:
-                selected_display = st.selectbox(flag_label, options=list(bool_options_map_display.keys()))
-                input_values_from_widgets[flag_col] = bool_options_map_display[selected_display]
-
-        if 'listing_color' in original_feature_columns: input_values_from_widgets['listing_color'] = st.selectbox("Listing Color Group", options=listing_color_options)
+    # Inputs live in a form so editing a widget doesn't rerun the whole script; it reruns on Predict
+    with st.form("car_form"):
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.subheader("Basic Info")
+            # Mileage
+            if 'mileage' in original_feature_columns:
+                mileage = st.number_input("Mileage", min_value=0, value=50000, step=1000, help="Total miles the car has been driven.")
+                if mileage > 300000:
+                    st.warning("High mileage: This is above typical values for most used cars.")
+                elif mileage < 1000:
+                    st.info("Very low mileage: Is this a nearly new car?")
+                input_values_from_widgets['mileage'] = mileage
+            # Car Age
+            if 'car_age' in original_feature_columns:
+                car_age = st.number_input("Car Age (years)", min_value=0, max_value=100, value=5, step=1, help="How many years since the car was manufactured.")
+                if car_age > 30:
+                    st.warning("This is an unusually old car.")
+                elif car_age < 1:
+                    st.info("Is this a new or nearly new car?")
+                input_values_from_widgets['car_age'] = car_age
+            # Horsepower
+            if 'horsepower' in original_feature_columns:
+                horsepower = st.number_input("Horsepower (HP)", min_value=10, max_value=1200, value=200, step=10, help="Engine power. Typical cars range from 70 to 400 HP.")
+                if horsepower > 1200 or horsepower < 10:
+                    st.error("Horsepower must be between 10 and 1200.")
+                    valid_inputs = False
+                elif horsepower > 600:
+                    st.warning("High horsepower: This is above typical values for most cars.")
+                elif horsepower < 50:
+                    st.info("Very low horsepower: Is this a compact or economy car?")
+                input_values_from_widgets['horsepower'] = horsepower
+            # Engine Displacement
+            if 'engine_displacement' in original_feature_columns:
+                engine_displacement = st.number_input("Engine Displacement (L)", min_value=0.1, max_value=10.0, value=2.5, step=0.1, format="%.1f", help="Total engine size in liters.")
+                if engine_displacement > 10.0 or engine_displacement < 0.1:
+                    st.error("Engine displacement must be between 0.1 and 10.0.")
+                    valid_inputs = False
+                elif engine_displacement > 6.0:
+                    st.warning("Large engine displacement: This is above typical values for most cars.")
+                elif engine_displacement < 1.0:
+                    st.info("Small engine: Is this a compact or hybrid car?")
+                input_values_from_widgets['engine_displacement'] = engine_displacement
+            # Fuel Tank Volume
+            if 'fuel_tank_volume' in original_feature_columns:
+                fuel_tank_volume = st.number_input("Fuel Tank Volume (gal)", min_value=1.0, max_value=100.0, value=15.0, step=0.1, format="%.1f", help="Capacity of the fuel tank in gallons.")
+                if fuel_tank_volume < 1.0 or fuel_tank_volume > 100.0:
+                    st.error("Fuel tank volume must be between 1.0 and 100.0 gallons.")
+                    valid_inputs = False
+                input_values_from_widgets['fuel_tank_volume'] = fuel_tank_volume
+            # City Fuel Economy
+            if 'city_fuel_economy' in original_feature_columns:
+                city_fuel_economy = st.number_input("City Fuel Economy (MPG)", min_value=1, max_value=150, value=20, step=1, help="Miles per gallon in city driving conditions.")
+                if city_fuel_economy < 1 or city_fuel_economy > 150:
+                    st.error("City fuel economy must be between 1 and 150 MPG.")
+                    valid_inputs = False
+                input_values_from_widgets['city_fuel_economy'] = city_fuel_economy
+            # Highway Fuel Economy
+            if 'highway_fuel_economy' in original_feature_columns:
+                highway_fuel_economy = st.number_input("Highway Fuel Economy (MPG)", min_value=1, max_value=150, value=30, step=1, help="Miles per gallon on highways.")
+                if highway_fuel_economy < 1 or highway_fuel_economy > 150:
+                    st.error("Highway fuel economy must be between 1 and 150 MPG.")
+                    valid_inputs = False
+                input_values_from_widgets['highway_fuel_economy'] = highway_fuel_economy
+            # Days on Market
+            if 'daysonmarket' in original_feature_columns:
+                daysonmarket = st.number_input("Days on Market", min_value=0, value=30, step=1, help="How many days the car has been listed for sale.")
+                if daysonmarket < 0:
+                    st.error("Days on market cannot be negative.")
+                    valid_inputs = False
+                input_values_from_widgets['daysonmarket'] = daysonmarket
+            # Previous Owners
+            if 'owner_count' in original_feature_columns:
+                owner_count = st.number_input("Previous Owners", min_value=0, max_value=10, value=1, step=1, help="Number of previous owners.")
+                if owner_count > 10 or owner_count < 0:
+                    st.error("Value must be between 0 and 10.")
+                    valid_inputs = False
+                input_values_from_widgets['owner_count'] = owner_count
+            # Savings Amount
+            if 'savings_amount' in original_feature_columns:
+                savings_amount = st.number_input("Savings Amount ($)", min_value=0, value=0, step=100, help="Discount or savings on the car price, if any.")
+                if savings_amount < 0:
+                    st.error("Savings amount cannot be negative.")
+                    valid_inputs = False
+                input_values_from_widgets['savings_amount'] = savings_amount
+            # Seller Rating
+            if 'seller_rating' in original_feature_columns:
+                seller_rating = st.number_input("Seller Rating (0-5)", min_value=0.0, max_value=5.0, value=4.0, step=0.1, format="%.1f", help="Rating of the seller (0 = worst, 5 = best).")
+                if seller_rating < 0 or seller_rating > 5:
+                    st.error("Seller rating must be between 0 and 5.")
+                    valid_inputs = False
+                input_values_from_widgets['seller_rating'] = seller_rating
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        with col2:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.subheader("Engine & Dimensions")
+            if 'back_legroom' in original_feature_columns: input_values_from_widgets['back_legroom'] = st.number_input("Back Legroom (in)", min_value=10.0, max_value=60.0, value=35.0, step=0.1, format="%.1f")
+            if 'front_legroom' in original_feature_columns: input_values_from_widgets['front_legroom'] = st.number_input("Front Legroom (in)", min_value=20.0, max_value=70.0, value=40.0, step=0.1, format="%.1f")
+            if 'height' in original_feature_columns: input_values_from_widgets['height'] = st.number_input("Height (in)", min_value=30.0, max_value=120.0, value=60.0, step=0.1, format="%.1f")
+            if 'length' in original_feature_columns: input_values_from_widgets['length'] = st.number_input("Length (in)", min_value=80.0, max_value=300.0, value=180.0, step=0.1, format="%.1f")
+            if 'wheelbase' in original_feature_columns: input_values_from_widgets['wheelbase'] = st.number_input("Wheelbase (in)", min_value=50.0, max_value=200.0, value=100.0, step=0.1, format="%.1f")
+            if 'width' in original_feature_columns: input_values_from_widgets['width'] = st.number_input("Width (in)", min_value=40.0, max_value=120.0, value=70.0, step=0.1, format="%.1f")
+            if 'maximum_seating' in original_feature_columns: input_values_from_widgets['maximum_seating'] = st.number_input("Max Seating", min_value=1, max_value=15, value=5, step=1)
+
+            if 'body_type' in original_feature_columns: input_values_from_widgets['body_type'] = st.selectbox("Body Type", options=body_type_options)
+            if 'engine_cylinders' in original_feature_columns: input_values_from_widgets['engine_cylinders'] = st.selectbox("Engine Cylinders", options=engine_cylinders_options)
+            if 'engine_type' in original_feature_columns: input_values_from_widgets['engine_type'] = st.selectbox("Engine Type", options=engine_type_options)
+            if 'fuel_type' in original_feature_columns: input_values_from_widgets['fuel_type'] = st.selectbox("Fuel Type", options=fuel_type_options)
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        with col3:
+            st.markdown('<div class="card">', unsafe_allow_html=True)
+            st.subheader("Condition & Status")
+            bool_options_map_display = {"No": 0, "Yes": 1} # For display
+            for flag_col, flag_label in [
+                ('fleet', "Fleet Vehicle?"), ('frame_damaged', "Frame Damaged?"),
+                ('franchise_dealer', "Franchise Dealer?"), ('has_accidents', "Accidents Reported?"),
+                ('isCab', "Was a Cab/Taxi?"), ('is_new', "Is New (<2 yrs old)?"),
+                ('salvage', "Salvage Title?"), ('theft_title', "Theft on Title?")
+            ]:
+                if flag_col in original_feature_columns:
+                    selected_display = st.selectbox(flag_label, options=list(bool_options_map_display.keys()))
+                    input_values_from_widgets[flag_col] = bool_options_map_display[selected_display]
+
+            if 'listing_color' in original_feature_columns: input_values_from_widgets['listing_color'] = st.selectbox("Listing Color Group", options=listing_color_options)
         
-        if 'transmission' in original_feature_columns:
-            selected_display_trans = st.selectbox("Transmission", options=display_trans_opts)
-            # Map back to original value for the model (A, M, CVT etc. or Unknown)
-            original_trans_value = selected_display_trans # Default if not in map
-            for k, v in transmission_options_map.items():
-                if v == selected_display_trans:
-                    original_trans_value = k
-                    break
-            input_values_from_widgets['transmission'] = original_trans_value
+            if 'transmission' in original_feature_columns:
+                selected_display_trans = st.selectbox("Transmission", options=display_trans_opts)
+                # Map back to original value for the model (A, M, CVT etc. or Unknown)
+                input_values_from_widgets['transmission'] = display_to_original_trans.get(selected_display_trans, selected_display_trans)
             
-        if 'wheel_system' in original_feature_columns: input_values_from_widgets['wheel_system'] = st.selectbox("Wheel System", options=wheel_system_options)
-        st.markdown('</div>', unsafe_allow_html=True)
+            if 'wheel_system' in original_feature_columns: input_values_from_widgets['wheel_system'] = st.selectbox("Wheel System", options=wheel_system_options)
+            st.markdown('</div>', unsafe_allow_html=True)
 
-    st.markdown("---")
+        st.markdown("---")
     
-    # Predict button with animation, only enabled if valid_inputs is True
-    if not valid_inputs:
-        st.error("Please correct the highlighted input errors before predicting.")
-    predict_btn = st.button("Predict Price", type="primary", use_container_width=True, disabled=not valid_inputs)
+        # Predict button with animation; the form only sends new values on submit, so
+        # instead of disabling the button we skip predicting while valid_inputs is False
+        if not valid_inputs:
+            st.error("Please correct the highlighted input errors before predicting.")
+        predict_btn = st.form_submit_button("Predict Price", type="primary", use_container_width=True)
     
     # Results container
     results_container = st.container()
     
-    if predict_btn:
+    if predict_btn and valid_inputs:
         with st.spinner("Calculating price..."):
-            # Progress bar for animation
-            import time
-            progress = st.progress(0, text="Preparing input...")
-            for percent in range(1, 101, 20):
-                time.sleep(0.08)
-                progress.progress(percent, text=f"Processing... {percent}%")
-            progress.empty()
-            # Construct the input DataFrame exactly as the preprocessor expects it
-            input_df_data_final = {}
-            for col_name in original_feature_columns:
-                if col_name in input_values_from_widgets:
-                    value = input_values_from_widgets[col_name]
-                    if col_name not in categorical_widget_map and col_name not in boolean_flags:
-                        input_df_data_final[col_name] = pd.to_numeric(value, errors='coerce')
-                    else:
-                        input_df_data_final[col_name] = value
-                else:
-                    st.warning(f"Input for feature '{col_name}' was not collected. Using NaN or 'Unknown'.")
-                    if col_name not in categorical_widget_map and col_name not in boolean_flags:
-                        input_df_data_final[col_name] = np.nan
-                    else:
-                        input_df_data_final[col_name] = 'Unknown'
-            try:
-                input_df = pd.DataFrame([input_df_data_final], columns=original_feature_columns)
-                for col in input_df.columns:
-                    if col in numerical_cols:
-                        try:
-                            if input_df[col].iloc[0] is not None and not pd.isna(input_df[col].iloc[0]):
-                                 input_df[col] = pd.to_numeric(input_df[col], errors='coerce')
-                        except:
-                            input_df[col] = np.nan
+            error = _validate_input(input_values_from_widgets)
+            prediction = None
+            if error is not None:
                 with results_container:
-                    with st.expander("View Input Data"):
-                        st.dataframe(input_df.T.astype(str))
-                processed_input = preprocessor.transform(input_df)
-                prediction = model.predict(processed_input)
-                final_price_usd = round(prediction[0], 2)
+                    st.error(f"Invalid input: {error}")
+            else:
+                # Fill the typed buffers by column index; missing inputs stay NaN / 'Unknown'
+                num_buf = np.full((1, len(num_idx)), np.nan)
+                cat_buf = np.full((1, len(cat_idx)), 'Unknown', dtype=object)
+                for col_name in original_feature_columns:
+                    if col_name not in input_values_from_widgets:
+                        st.warning(f"Input for feature '{col_name}' was not collected. Using NaN or 'Unknown'.")
+                    elif col_name in cat_idx:
+                        cat_buf[0, cat_idx[col_name]] = input_values_from_widgets[col_name]
+                    else:
+                        # Validated as a number (or None), so a plain float() cast is enough
+                        value = input_values_from_widgets[col_name]
+                        num_buf[0, num_idx[col_name]] = float(value) if value is not None else np.nan
+                if show_input_data:
+                    input_df = build_input_df(num_buf, cat_buf)
+                    with results_container:
+                        with st.expander("View Input Data"):
+                            st.dataframe(input_df.T.astype(str))
+                try:
+                    prediction = predict_usd(num_buf, cat_buf)
+                except (ValueError, KeyError) as e:
+                    with results_container:
+                        st.error(f"An error occurred during prediction: {e}")
+                        st.error(f"Expected columns by preprocessor: {original_feature_columns}")
+            if prediction is not None:
+                final_price_usd = round(prediction, 2)
                 # Show toast feedback
                 st.toast("Prediction complete!", icon="🎉")
                 # Show prediction
-                exchange_rate = get_exchange_rates().get(selected_currency, 1.0)
+                exchange_rate = exchange_rates.get(selected_currency, 1.0)
                 final_price = final_price_usd * exchange_rate
                 if selected_currency == "JPY":
                     formatted_price = f"{int(final_price):,}"
@@ -606,44 +963,12 @@ if model is not None and preprocessor is not None and original_feature_columns i
                             (USD: ${final_price_usd:,.2f})
                         </div>
                         """, unsafe_allow_html=True)
-                    # Car image based on body type
-                    car_images = {
-                        "Sedan": "https://img.icons8.com/color/96/000000/sedan.png",
-                        "SUV / Crossover": "https://img.icons8.com/color/96/000000/suv.png",
-                        "Pickup Truck": "https://img.icons8.com/color/96/000000/pickup.png",
-                        "Coupe": "https://img.icons8.com/external-flaticons-lineal-color-flat-icons/64/external-coupe-automotive-ecommerce-flaticons-lineal-color-flat-icons-3.png",
-                        "Convertible": "https://img.icons8.com/color/96/000000/convertible.png",
-                        "Wagon": "https://img.icons8.com/color/96/000000/station-wagon.png",
-                        "Minivan": "https://img.icons8.com/external-flaticons-lineal-color-flat-icons/64/external-minivan-automotive-ecommerce-flaticons-lineal-color-flat-icons.png",
-                        "Van": "https://img.icons8.com/color/96/000000/van.png",
-                        "Hatchback": "https://img.icons8.com/color/96/000000/hatchback.png"
-                    }
                     body_type = input_values_from_widgets.get('body_type', 'Sedan')
-                    car_image_url = car_images.get(body_type, "https://img.icons8.com/color/96/000000/car.png")
-                    st.markdown(f"""
-                    <div style="display: flex; justify-content: center; margin: 20px 0; background-color: rgba(255,255,255,0.2); padding: 20px; border-radius: 50%; width: 120px; height: 120px; margin-left: auto; margin-right: auto; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px);">
-                        <img src="{car_image_url}" width="96" height="96" alt="{body_type}" style="object-fit: contain;">
-                    </div>
-                    <div style="text-align: center; margin-bottom: 30px; background-color: rgba(0,0,0,0.2); padding: 10px; border-radius: 8px; backdrop-filter: blur(5px); -webkit-backdrop-filter: blur(5px);">
-                        <span style="font-weight: bold; color: white;">{body_type}</span>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    st.balloons()
-            except Exception as e:
-                with results_container:
-                    st.error(f"An error occurred during prediction: {e}")
-                    st.error(f"Expected columns by preprocessor: {original_feature_columns}")
-                    if 'input_df' in locals():
-                        st.error(f"Columns in DataFrame sent to preprocessor: {input_df.columns.tolist()}")
-                        st.error(f"Data types of input_df sent to preprocessor: \n{input_df.dtypes}")
+                    car_image_url = _BODY_IMAGE_URLS.get(body_type, _DEFAULT_BODY_IMAGE_URL)
+                    st.markdown(_RESULT_CARD_TMPL.format(car_image_url=car_image_url, body_type=body_type), unsafe_allow_html=True)
+                    if celebrate:
+                        st.balloons()
 
 # Add a modern footer
-st.markdown("""
-<div style="text-align: center; color: #888; font-size: 0.95em; margin-top: 40px; padding-bottom: 10px;">
-    Made with ❤️ by Mohanad &middot; Powered by Streamlit
-</div>
-""", unsafe_allow_html=True)
-
-st.markdown("---")
+st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
 st.caption("Note: This prediction is based on a machine learning model and should be used as an estimate.")
-st.markdown('</div>', unsafe_allow_html=True)